@@ -1,21 +1,129 @@
 # db.py
 import sqlite3
 import json
-from datetime import datetime
+import os
+import atexit
+import threading
+import time
+import notify
 
 DB_FILE = "queue.db"
 
-def get_db_connection():
-    """Returns a connection to the SQLite database."""
-    conn = sqlite3.connect(DB_FILE, timeout=10)  # 10s timeout for locks
+# Tuning applied to every connection, after WAL is enabled.
+# busy_timeout replaces the Python-level connect timeout: SQLite retries
+# locked operations itself for up to 5s.
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL;",
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA cache_size=-65536;",  # 64 MB page cache
+    "PRAGMA mmap_size=1073741824;",  # 1 GB memory-mapped I/O
+    "PRAGMA busy_timeout=5000;",
+    "PRAGMA foreign_keys=ON;",
+)
+
+# Long-lived connections per thread, reused across calls: a writer for
+# everything that mutates, and a query-only reader for CLI lookups so they
+# never queue up inside a writer transaction.
+_tls = threading.local()
+
+# Connections inherited from the parent across fork(). SQLite forbids using
+# them in the child, and closing them would release the parent's file locks
+# here too, so they are kept referenced and never touched.
+_forked_conns = []
+
+def _open_connection(query_only=False):
+    """Opens and tunes a new connection in autocommit mode."""
+    # A larger statement cache keeps every query in this module prepared
+    # for the lifetime of the connection.
+    conn = sqlite3.connect(DB_FILE, isolation_level=None, cached_statements=256)
     conn.row_factory = sqlite3.Row
     # Enable Write-Ahead Logging for better concurrency
     conn.execute("PRAGMA journal_mode=WAL;")
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    if query_only:
+        conn.execute("PRAGMA query_only=ON;")
     return conn
 
+def _thread_connection(role):
+    """Returns this thread's cached 'writer' or 'reader' connection."""
+    if getattr(_tls, 'pid', None) != os.getpid():
+        # Connections inherited across fork() must not be reused by the child
+        _forked_conns.extend(getattr(_tls, 'conns', {}).values())
+        _tls.conns = {}
+        _tls.pid = os.getpid()
+    conn = _tls.conns.get(role)
+    if conn is None:
+        conn = _open_connection(query_only=(role == 'reader'))
+        _tls.conns[role] = conn
+    return conn
+
+def get_db_connection():
+    """
+    Returns this thread's writer connection to the SQLite database.
+    The connection runs in autocommit mode: single statements commit on their own,
+    multi-statement work must use an explicit BEGIN/COMMIT.
+    """
+    return _thread_connection('writer')
+
+def get_reader_connection():
+    """Returns this thread's read-only connection to the SQLite database."""
+    return _thread_connection('reader')
+
+def close_db_connections():
+    """
+    Closes this thread's connections, running PRAGMA optimize on the writer
+    first so the query planner statistics stay fresh as the table grows.
+    """
+    if getattr(_tls, 'pid', None) != os.getpid():
+        return
+    conns = _tls.conns
+    _tls.conns = {}
+    writer = conns.pop('writer', None)
+    if writer is not None:
+        try:
+            writer.execute("PRAGMA optimize;")
+        except sqlite3.OperationalError:
+            pass  # Best effort only; the database may be busy
+        writer.close()
+    for conn in conns.values():
+        conn.close()
+
+atexit.register(close_db_connections)
+
+def checkpoint_wal(mode='PASSIVE'):
+    """
+    Copies WAL contents back into the database file. PASSIVE never waits on
+    other connections; TRUNCATE also resets queue.db-wal to zero bytes.
+    """
+    conn = get_db_connection()
+    conn.execute(f"PRAGMA wal_checkpoint({mode});").fetchone()
+
+# Stored in PRAGMA user_version by init_db(). Bump it when the schema changes
+# so existing databases are migrated on their next CLI call.
+SCHEMA_VERSION = 1
+
+def ensure_db():
+    """
+    Initializes the database only if it isn't already at SCHEMA_VERSION.
+    Reading user_version is a header lookup, so this is cheap enough for every CLI call.
+    """
+    conn = get_reader_connection()
+    if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+        init_db()
+
 def init_db():
     """Initializes the database schema and default config."""
-    with get_db_connection() as conn:
+    conn = get_db_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Databases created before timestamps became epoch milliseconds store
+        # them as ISO-8601 TEXT; move that table aside and copy it over below.
+        columns = {row['name']: row['type'] for row in conn.execute("PRAGMA table_info(jobs)")}
+        legacy_timestamps = columns.get('created_at') == 'TEXT'
+        if legacy_timestamps:
+            conn.execute("ALTER TABLE jobs RENAME TO jobs_legacy")
+
         conn.execute("""
             CREATE TABLE IF NOT EXISTS jobs (
                 id TEXT PRIMARY KEY,
@@ -23,11 +131,32 @@ def init_db():
                 state TEXT NOT NULL DEFAULT 'pending',
                 attempts INTEGER NOT NULL DEFAULT 0,
                 max_retries INTEGER NOT NULL,
-                run_at TEXT, -- ISO-8601 timestamp for backoff
-                created_at TEXT NOT NULL,
-                updated_at TEXT NOT NULL
+                run_at INTEGER, -- epoch milliseconds, for backoff
+                created_at INTEGER NOT NULL, -- epoch milliseconds
+                updated_at INTEGER NOT NULL -- epoch milliseconds
             )
         """)
+        if legacy_timestamps:
+            conn.execute("""
+                INSERT INTO jobs (id, command, state, attempts, max_retries, run_at, created_at, updated_at)
+                SELECT id, command, state, attempts, max_retries,
+                       CAST(ROUND((julianday(run_at) - 2440587.5) * 86400000) AS INTEGER),
+                       CAST(ROUND((julianday(created_at) - 2440587.5) * 86400000) AS INTEGER),
+                       CAST(ROUND((julianday(updated_at) - 2440587.5) * 86400000) AS INTEGER)
+                FROM jobs_legacy
+            """)
+            # Also drops the old table's indexes, so they are recreated below
+            conn.execute("DROP TABLE jobs_legacy")
+
+        # Serves the claim query (pending jobs in created_at order, run_at checked
+        # from the index) as well as listing and counting jobs by state.
+        new_index = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_jobs_claim'"
+        ).fetchone() is None
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (state, created_at, run_at)")
+        if new_index:
+            # Give the query planner statistics for the new index
+            conn.execute("ANALYZE")
         conn.execute("""
             CREATE TABLE IF NOT EXISTS config (
                 key TEXT PRIMARY KEY,
@@ -37,127 +166,201 @@ def init_db():
         # Set default configuration
         conn.execute("INSERT OR IGNORE INTO config (key, value) VALUES ('max_retries', '3')")
         conn.execute("INSERT OR IGNORE INTO config (key, value) VALUES ('backoff_base', '2')")
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
         conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+# In-process copy of the config table. It is reloaded only when PRAGMA
+# data_version on the reader connection moves. The reader never writes, so
+# any commit moves it, including this process's own writer commits.
+_config_cache = {}
+_config_seen = None  # (reader connection, data_version) the cache was loaded at
 
 def get_config_value(key):
     """Gets a configuration value by key."""
-    with get_db_connection() as conn:
-        row = conn.execute("SELECT value FROM config WHERE key = ?", (key,)).fetchone()
-        return row['value'] if row else None
+    global _config_seen
+    conn = get_reader_connection()
+    seen = (conn, conn.execute("PRAGMA data_version").fetchone()[0])
+    if seen != _config_seen:
+        rows = conn.execute("SELECT key, value FROM config").fetchall()
+        _config_cache.clear()
+        _config_cache.update((row['key'], row['value']) for row in rows)
+        _config_seen = seen
+    return _config_cache.get(key)
 
 def set_config_value(key, value):
     """Sets a configuration value."""
-    with get_db_connection() as conn:
-        conn.execute("INSERT OR REPLACE INTO config (key, value) VALUES (?, ?)", (key, str(value)))
-        conn.commit()
+    conn = get_db_connection()
+    conn.execute("INSERT OR REPLACE INTO config (key, value) VALUES (?, ?)", (key, str(value)))
+
+INSERT_JOB_SQL = """
+    INSERT INTO jobs (id, command, state, max_retries, created_at, updated_at)
+    VALUES (?, ?, 'pending', ?, ?, ?)
+"""
+
+def _job_params(job_data, default_retries, now):
+    """Builds the INSERT_JOB_SQL parameters for one job."""
+    return (
+        job_data['id'],
+        job_data['command'],
+        job_data.get('max_retries', default_retries),
+        now,
+        now,
+    )
 
 def create_job(job_data):
     """Enqueues a new job."""
-    now = datetime.utcnow().isoformat()
+    now = int(time.time() * 1000)
     default_retries = get_config_value('max_retries')
     
-    with get_db_connection() as conn:
-        conn.execute(
-            """
-            INSERT INTO jobs (id, command, state, max_retries, created_at, updated_at)
-            VALUES (?, ?, 'pending', ?, ?, ?)
-            """,
-            (
-                job_data['id'],
-                job_data['command'],
-                job_data.get('max_retries', default_retries),
-                now,
-                now,
-            ),
+    conn = get_db_connection()
+    conn.execute(INSERT_JOB_SQL, _job_params(job_data, default_retries, now))
+    notify.notify_workers()
+
+def create_jobs_bulk(job_list):
+    """
+    Enqueues many jobs in a single transaction (one commit for the whole batch).
+    Either every job is inserted or, on error, none are.
+    """
+    now = int(time.time() * 1000)
+    default_retries = get_config_value('max_retries')
+
+    conn = get_db_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(
+            INSERT_JOB_SQL,
+            (_job_params(job_data, default_retries, now) for job_data in job_list),
         )
         conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    notify.notify_workers(len(job_list))
+
+# Kept as one constant so every claim reuses the same prepared statement
+CLAIM_JOB_SQL = """
+    UPDATE jobs SET state = 'processing', updated_at = ?
+    WHERE id = (
+        SELECT id FROM jobs
+        WHERE state = 'pending'
+          AND (run_at IS NULL OR run_at <= ?)
+        ORDER BY created_at ASC
+        LIMIT 1
+    )
+    RETURNING *
+"""
 
 def fetch_job_atomically():
     """
     Atomically fetches the next pending job and marks it as 'processing'.
     This is the core locking mechanism.
     """
-    now = datetime.utcnow().isoformat()
-    with get_db_connection() as conn:
-        # Start an IMMEDIATE transaction. This locks the database for writing.
-        # No other worker can start its own transaction until this one is committed.
-        conn.execute("BEGIN IMMEDIATE")
-        try:
-            job_row = conn.execute(
-                """
-                SELECT * FROM jobs
-                WHERE state = 'pending'
-                  AND (run_at IS NULL OR run_at <= ?)
-                ORDER BY created_at ASC
-                LIMIT 1
-                """,
-                (now,),
-            ).fetchone()
-
-            if job_row:
-                job_id = job_row['id']
-                conn.execute(
-                    "UPDATE jobs SET state = 'processing', updated_at = ? WHERE id = ?",
-                    (now, job_id),
-                )
-                conn.commit()
-                return dict(job_row)  # Return the job as a dictionary
-            else:
-                conn.commit()  # Nothing to do, just commit (release lock)
-                return None
-        except sqlite3.OperationalError as e:
-            # Handle "database is locked" gracefully if it ever happens
-            print(f"Database lock error: {e}")
-            conn.rollback()
-            return None
-        except Exception as e:
-            conn.rollback()
-            raise e
+    now = int(time.time() * 1000)
+    conn = get_db_connection()
+    # A single UPDATE ... RETURNING both picks and claims the job. In autocommit
+    # mode it runs as its own write transaction, so no other worker can claim
+    # the same row, and the write lock is held only for this one statement.
+    try:
+        job_row = conn.execute(CLAIM_JOB_SQL, (now, now)).fetchone()
+    except sqlite3.OperationalError as e:
+        # Handle "database is locked" gracefully if it ever happens
+        print(f"Database lock error: {e}")
+        return None
+
+    return dict(job_row) if job_row else None
+
+def get_data_version():
+    """
+    Returns PRAGMA data_version for this thread's writer connection. It changes
+    whenever another connection commits, and is read without touching any table.
+    """
+    conn = get_db_connection()
+    return conn.execute("PRAGMA data_version").fetchone()[0]
+
+def get_next_run_at():
+    """
+    Returns the earliest run_at (epoch milliseconds) among pending jobs,
+    or None if no pending job is waiting on a backoff.
+    """
+    conn = get_reader_connection()
+    row = conn.execute("SELECT MIN(run_at) FROM jobs WHERE state = 'pending'").fetchone()
+    return row[0]
 
 def update_job_state(job_id, state):
     """Updates a job's state (e.g., to 'completed' or 'dead')."""
-    now = datetime.utcnow().isoformat()
-    with get_db_connection() as conn:
-        conn.execute(
-            "UPDATE jobs SET state = ?, updated_at = ? WHERE id = ?",
-            (state, now, job_id),
-        )
-        conn.commit()
+    now = int(time.time() * 1000)
+    conn = get_db_connection()
+    conn.execute(
+        "UPDATE jobs SET state = ?, updated_at = ? WHERE id = ?",
+        (state, now, job_id),
+    )
 
-def update_job_for_retry(job_id, attempts, run_at):
-    """Schedules a job for retry with backoff."""
-    now = datetime.utcnow().isoformat()
-    with get_db_connection() as conn:
-        conn.execute(
-            "UPDATE jobs SET state = 'pending', attempts = ?, run_at = ?, updated_at = ? WHERE id = ?",
-            (attempts, run_at.isoformat(), now, job_id),
-        )
-        conn.commit()
+def update_failed_job(job_id, state, attempts, run_at=None):
+    """
+    Records a failed job's new state and attempt count ('pending' for a retry,
+    'dead' for the DLQ). run_at (epoch milliseconds) is only set for retries;
+    None keeps the job's current run_at.
+    """
+    now = int(time.time() * 1000)
+    conn = get_db_connection()
+    conn.execute(
+        "UPDATE jobs SET state = ?, attempts = ?, run_at = COALESCE(?, run_at), updated_at = ? WHERE id = ?",
+        (state, attempts, run_at, now, job_id),
+    )
 
 def get_jobs_by_state(state):
-    """Lists all jobs with a given state."""
-    with get_db_connection() as conn:
-        rows = conn.execute("SELECT * FROM jobs WHERE state = ? ORDER BY created_at", (state,)).fetchall()
-        return [dict(row) for row in rows]
+    """Yields all jobs with a given state, streamed from the cursor one at a time."""
+    conn = get_reader_connection()
+    cursor = conn.execute("SELECT * FROM jobs WHERE state = ? ORDER BY created_at", (state,))
+    for row in cursor:
+        yield dict(row)
+
+def get_all_jobs_ordered():
+    """Yields all jobs grouped by state (pending, processing, completed, dead), streamed."""
+    conn = get_reader_connection()
+    cursor = conn.execute(
+        """
+        SELECT * FROM jobs
+        ORDER BY CASE state
+                     WHEN 'pending' THEN 0
+                     WHEN 'processing' THEN 1
+                     WHEN 'completed' THEN 2
+                     WHEN 'dead' THEN 3
+                 END,
+                 created_at
+        """
+    )
+    for row in cursor:
+        yield dict(row)
 
 def get_status_summary():
     """Gets a count of jobs by state."""
-    with get_db_connection() as conn:
-        rows = conn.execute(
-            "SELECT state, COUNT(*) as count FROM jobs GROUP BY state"
-        ).fetchall()
-        return {row['state']: row['count'] for row in rows}
+    conn = get_reader_connection()
+    # One pass over the state column (covered by idx_jobs_claim) counts every state
+    row = conn.execute(
+        """
+        SELECT COALESCE(SUM(state = 'pending'), 0) AS pending,
+               COALESCE(SUM(state = 'processing'), 0) AS processing,
+               COALESCE(SUM(state = 'completed'), 0) AS completed,
+               COALESCE(SUM(state = 'dead'), 0) AS dead
+        FROM jobs
+        """
+    ).fetchone()
+    return dict(row)
 
 def reset_job_for_retry(job_id):
     """Resets a 'dead' job to 'pending' from the DLQ."""
-    now = datetime.utcnow().isoformat()
-    with get_db_connection() as conn:
-        # We must use a cursor to get the 'rowcount'
-        cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE jobs SET state = 'pending', attempts = 0, run_at = NULL, updated_at = ? WHERE id = ? AND state = 'dead'",
-            (now, job_id),
-        )
-        conn.commit()
-        # Check how many rows were changed by the cursor
-        return cursor.rowcount > 0
+    now = int(time.time() * 1000)
+    conn = get_db_connection()
+    cursor = conn.execute(
+        "UPDATE jobs SET state = 'pending', attempts = 0, run_at = NULL, updated_at = ? WHERE id = ? AND state = 'dead'",
+        (now, job_id),
+    )
+    # Check how many rows were changed by the statement
+    if cursor.rowcount > 0:
+        notify.notify_workers()
+        return True
+    return False
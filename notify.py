@@ -0,0 +1,101 @@
+# notify.py
+import os
+import select
+import signal
+import tempfile
+import time
+
+# Named pipe that producers write to whenever new work becomes claimable.
+# The pipe is level-triggered: one byte makes select() return in every idle
+# worker, but only the worker that reads the byte returns from wait() and
+# goes on to claim. The others go straight back to waiting.
+WAKE_FIFO = os.path.join(tempfile.gettempdir(), "queuectl_wake")
+
+# Cap on bytes written per notification. Bytes beyond the number of idle
+# workers stay in the pipe and make later waits return at once, each costing
+# the worker one loop iteration; the cap bounds that leftover after a bulk enqueue.
+MAX_WAKEUPS = 64
+
+def notify_workers(count=1):
+    """
+    Lets up to 'count' idle workers through to claim a job. Never blocks, and is a no-op when no
+    worker is listening (or on platforms without named pipes).
+    """
+    if not hasattr(os, 'mkfifo'):
+        return
+    try:
+        fd = os.open(WAKE_FIFO, os.O_WRONLY | os.O_NONBLOCK)
+    except OSError:
+        # No FIFO yet, or no worker has it open: nobody to wake
+        return
+    try:
+        os.write(fd, b'\0' * min(count, MAX_WAKEUPS))
+    except BlockingIOError:
+        pass  # Pipe is full, so plenty of wakeups are already pending
+    finally:
+        os.close(fd)
+
+class WakeListener:
+    """
+    Lets an idle worker block until a job is enqueued, a signal arrives,
+    or a timeout passes. Falls back to a 1-second poll where named pipes
+    are not available (Windows).
+    """
+
+    def __init__(self):
+        self.fifo_fd = None
+        if not hasattr(os, 'mkfifo'):
+            return
+        try:
+            try:
+                os.mkfifo(WAKE_FIFO)
+            except FileExistsError:
+                pass
+            # O_RDWR keeps a writer open on our side, so the FIFO never reports EOF
+            self.fifo_fd = os.open(WAKE_FIFO, os.O_RDWR | os.O_NONBLOCK)
+        except OSError as e:
+            print(f"Worker (PID: {os.getpid()}): Wake pipe unavailable ({e}), polling instead.")
+            return
+
+        # A signal (e.g. SIGTERM from 'worker stop') writes to this pipe,
+        # so a pending shutdown interrupts the wait immediately.
+        self.signal_r, self.signal_w = os.pipe()
+        os.set_blocking(self.signal_r, False)
+        os.set_blocking(self.signal_w, False)
+        signal.set_wakeup_fd(self.signal_w)
+
+    def wait(self, timeout):
+        """
+        Waits up to 'timeout' seconds until this worker takes a wakeup byte
+        or a signal arrives.
+        """
+        if self.fifo_fd is None:
+            time.sleep(min(timeout, 1))
+            return
+
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = max(0.0, deadline - time.monotonic())
+            ready, _, _ = select.select([self.fifo_fd, self.signal_r], [], [], remaining)
+            if not ready:
+                return  # Timed out
+            if self.signal_r in ready:
+                try:
+                    os.read(self.signal_r, 4096)
+                except BlockingIOError:
+                    pass
+                return
+            # Consume a single wakeup and leave the rest for other idle workers
+            try:
+                os.read(self.fifo_fd, 1)
+                return
+            except BlockingIOError:
+                pass  # Another worker took it first; keep waiting
+
+    def close(self):
+        if self.fifo_fd is None:
+            return
+        signal.set_wakeup_fd(-1)
+        for fd in (self.fifo_fd, self.signal_r, self.signal_w):
+            os.close(fd)
+        self.fifo_fd = None
@@ -1,10 +1,14 @@
 #!/usr/bin/env python
 # queuectl.py
 import click
+import functools
+import itertools
 import json
 import os
 import signal
+import sys
 import time
+import traceback
 import multiprocessing
 from datetime import datetime
 import db
@@ -12,7 +16,6 @@ import worker
 
 # *** MODIFIED PART ***
 import tempfile
-import psutil  # Import the new dependency
 # Use a cross-platform temp directory
 PID_DIR = os.path.join(tempfile.gettempdir(), "queuectl_pids")
 # *** END MODIFIED PART ***
@@ -27,6 +30,42 @@ def get_pid_files():
         return []
     return [os.path.join(PID_DIR, f) for f in os.listdir(PID_DIR) if f.endswith('.pid')]
 
+# Worker PIDs only need checking once per CLI invocation
+@functools.lru_cache(maxsize=None)
+def pid_exists(pid):
+    """Checks whether a process with the given PID is running."""
+    if os.name == 'nt':
+        # os.kill(pid, 0) would signal the process on Windows
+        return _windows_pid_exists(pid)
+    try:
+        os.kill(pid, 0)  # Signal 0 only checks that the process exists
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Exists, but belongs to another user
+    return True
+
+def _windows_pid_exists(pid):
+    """Windows version of pid_exists(), using the Win32 process API."""
+    import ctypes
+    PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+    ERROR_ACCESS_DENIED = 5
+    STILL_ACTIVE = 259
+
+    kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+    handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+    if not handle:
+        # Access denied means it exists, but belongs to another user
+        return ctypes.get_last_error() == ERROR_ACCESS_DENIED
+    try:
+        # A handle can still be opened for a process that has already exited
+        exit_code = ctypes.c_ulong()
+        if kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code)):
+            return exit_code.value == STILL_ACTIVE
+        return True
+    finally:
+        kernel32.CloseHandle(handle)
+
 def get_active_workers():
     """Counts how many worker processes are actually running."""
     pids = []
@@ -36,8 +75,7 @@ def get_active_workers():
                 pid = int(f.read().strip())
             
             # *** MODIFIED PART ***
-            # Use psutil.pid_exists() for a cross-platform check
-            if psutil.pid_exists(pid):
+            if pid_exists(pid):
                 pids.append(pid)
             else:
                 # Process doesn't exist, clean up stale file
@@ -57,7 +95,7 @@ def cli():
     """
     QueueCTL - A CLI-based background job queue system.
     """
-    db.init_db()
+    db.ensure_db()
     ensure_pid_dir()
 
 # --- Enqueue Command ---
@@ -83,6 +121,41 @@ def enqueue(job_json_string):
     except Exception as e:
         click.echo(f"Error: {e}", err=True)
 
+@cli.command(name="enqueue-bulk")
+@click.argument('input_file', type=click.File('r'), default='-')
+def enqueue_bulk(input_file):
+    """
+    Add many jobs at once from newline-delimited JSON (one job per line).
+    Reads from stdin by default. Example: python queuectl.py enqueue-bulk < jobs.ndjson
+    """
+    jobs = []
+    for line_no, line in enumerate(input_file, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            job_data = json.loads(line)
+        except json.JSONDecodeError:
+            click.echo(f"Error: Invalid JSON on line {line_no}. No jobs enqueued.", err=True)
+            return
+        if not isinstance(job_data, dict):
+            click.echo(f"Error: Job on line {line_no} must be a JSON object. No jobs enqueued.", err=True)
+            return
+        if 'id' not in job_data or 'command' not in job_data:
+            click.echo(f"Error: Job on line {line_no} must contain 'id' and 'command'. No jobs enqueued.", err=True)
+            return
+        jobs.append(job_data)
+
+    if not jobs:
+        click.echo("No jobs found in input.")
+        return
+
+    try:
+        db.create_jobs_bulk(jobs)
+        click.echo(f"{len(jobs)} job(s) enqueued.")
+    except Exception as e:
+        click.echo(f"Error: {e}. No jobs enqueued.", err=True)
+
 # --- Worker Commands ---
 @cli.group()
 def worker_group():
@@ -93,6 +166,13 @@ def worker_group():
 @click.option('--count', default=1, help='Number of workers to start.')
 def worker_start(count):
     """Start one or more workers in the background."""
+    if os.name != 'nt':
+        pids = [fork_worker() for _ in range(count)]
+        for pid in pids:
+            write_pid_file(pid)
+        click.echo(f"Started {count} worker(s) with PIDs: {pids}")
+        return
+
     processes = []
     
     # This 'if' block is required for 'multiprocessing' on Windows
@@ -103,14 +183,43 @@ def worker_start(count):
             p = multiprocessing.Process(target=worker.run_worker)
             p.start()
             processes.append(p)
-            
-            # Store PID in a file
-            pid_file = os.path.join(PID_DIR, f"{p.pid}.pid")
-            with open(pid_file, 'w') as f:
-                f.write(str(p.pid))
+            write_pid_file(p.pid)
                 
         click.echo(f"Started {count} worker(s) with PIDs: {[p.pid for p in processes]}")
 
+def fork_worker():
+    """Forks a worker process (POSIX only) and returns its PID."""
+    # The child must not inherit open SQLite connections
+    db.close_db_connections()
+    # Flush first so buffered output isn't written twice
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        # Child: run the worker, then exit without running the CLI's cleanup
+        exit_code = 0
+        try:
+            worker.run_worker()
+        except BaseException:
+            traceback.print_exc()
+            exit_code = 1
+        finally:
+            # os._exit() skips the interpreter's own flush, which would lose
+            # buffered worker output when stdout is redirected to a file
+            for stream in (sys.stdout, sys.stderr):
+                try:
+                    stream.flush()
+                except Exception:
+                    pass
+            os._exit(exit_code)
+    return pid
+
+def write_pid_file(pid):
+    """Records a worker's PID so 'status' and 'worker stop' can find it."""
+    pid_file = os.path.join(PID_DIR, f"{pid}.pid")
+    with open(pid_file, 'w') as f:
+        f.write(str(pid))
+
 @worker_group.command(name="stop")
 @click.option('--all', is_flag=True, help="Stop all running workers.")
 def worker_stop(all):
@@ -146,18 +255,17 @@ def list(state):
         jobs = db.get_jobs_by_state(state)
         click.echo(f"--- Jobs in '{state}' state ---")
     else:
-        jobs = db.get_jobs_by_state('pending') + \
-               db.get_jobs_by_state('processing') + \
-               db.get_jobs_by_state('completed') + \
-               db.get_jobs_by_state('dead')
+        jobs = db.get_all_jobs_ordered()
         click.echo("--- All Jobs ---")
 
-    if not jobs:
-        click.echo("No jobs found.")
-        return
-
+    # 'jobs' is a generator, so count while printing instead of checking it up front
+    count = 0
     for job in jobs:
         click.echo(f"ID: {job['id']} | State: {job['state']} | Attempts: {job['attempts']} | Command: {job['command']}")
+        count += 1
+
+    if count == 0:
+        click.echo("No jobs found.")
 
 @cli.command()
 def status():
@@ -183,12 +291,13 @@ def dlq():
 def dlq_list():
     """View all jobs in the DLQ."""
     jobs = db.get_jobs_by_state('dead')
-    if not jobs:
+    first_job = next(jobs, None)
+    if first_job is None:
         click.echo("DLQ is empty.")
         return
         
     click.echo("--- Dead Letter Queue ---")
-    for job in jobs:
+    for job in itertools.chain([first_job], jobs):
         click.echo(f"ID: {job['id']} | Attempts: {job['attempts']} | Command: {job['command']}")
 
 @dlq.command(name="retry")
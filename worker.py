@@ -1,15 +1,33 @@
 # worker.py
 import subprocess
+import shlex
+import re
+import random
 import time
 import signal
 import sys
 import os
 import db
-from datetime import datetime, timedelta
+import notify
 
 # Global flag for graceful shutdown
 SHUTDOWN_REQUESTED = False
 
+# Characters that need /bin/sh to interpret them (pipes, redirects, globs, expansions, ...)
+SHELL_SYNTAX = re.compile(r'[|&;<>$`*?\[\]{}()~#!\\\n]')
+
+# Source of retry jitter. Reseeded in each worker process (see run_worker)
+# so forked workers don't share one sequence and retry in lockstep.
+jitter_rng = random.Random(os.getpid())
+
+# Run a passive WAL checkpoint after this many jobs, so a long-running
+# worker doesn't let queue.db-wal grow without bound.
+CHECKPOINT_EVERY = 1000
+
+# Longest an idle worker waits before re-checking the queue on its own.
+# Enqueues wake it earlier through the notify pipe.
+MAX_IDLE_WAIT = 30.0
+
 def handle_shutdown_signal(signum, frame):
     """Set the flag to True when a shutdown signal is received."""
     global SHUTDOWN_REQUESTED
@@ -32,37 +50,89 @@ def run_worker():
     signal.signal(signal.SIGINT, handle_shutdown_signal)
     # *** END MODIFIED PART ***
     
+    jitter_rng.seed(os.getpid())
+
     # Initialize DB for this process
     db.init_db()
     
     print(f"Worker (PID: {os.getpid()}) started.")
 
+    wake_listener = notify.WakeListener()
+    jobs_processed = 0
+    # data_version at the last claim that found nothing, and the earliest
+    # pending run_at seen then. Until another process commits or that
+    # backoff expires, claiming again can't find anything new.
+    idle_version = None
+    next_run_at = None
+
     while not SHUTDOWN_REQUESTED:
-        job = db.fetch_job_atomically()
+        version = db.get_data_version()
+        if version == idle_version and (next_run_at is None or next_run_at / 1000 > time.time()):
+            job = None  # Nothing changed; skip the claim query
+        else:
+            job = db.fetch_job_atomically()
 
         if job:
+            idle_version = None
             print(f"Worker (PID: {os.getpid()}): Processing job {job['id']}...")
             execute_job(job)
+            jobs_processed += 1
+            if jobs_processed % CHECKPOINT_EVERY == 0:
+                db.checkpoint_wal('PASSIVE')
         else:
-            # No job found, sleep to prevent busy-waiting
+            # No job found, wait for an enqueue (or the next retry to fall due)
             if SHUTDOWN_REQUESTED:
                 break
-            time.sleep(1)
+            if version != idle_version:
+                idle_version = version
+                next_run_at = db.get_next_run_at()
+            wake_listener.wait(get_idle_timeout(next_run_at))
     
+    wake_listener.close()
+    # Leave a small WAL and fresh planner statistics behind
+    db.checkpoint_wal('TRUNCATE')
+    db.close_db_connections()
     print(f"Worker (PID: {os.getpid()}) shutting down.")
 
+def get_idle_timeout(next_run_at):
+    """Seconds to wait while idle: until next_run_at (epoch ms) passes, capped at MAX_IDLE_WAIT."""
+    if next_run_at is None:
+        return MAX_IDLE_WAIT
+    return min(MAX_IDLE_WAIT, max(0.0, next_run_at / 1000 - time.time()))
+
+def split_command(command):
+    """
+    Returns an argv list when the command can be exec'd directly without a
+    shell, or None when it needs shell interpretation.
+    """
+    # On Windows, 'shell=True' is often needed for commands like 'echo'
+    if os.name == 'nt' or SHELL_SYNTAX.search(command):
+        return None
+    try:
+        argv = shlex.split(command)
+    except ValueError:
+        return None  # e.g. unbalanced quotes; let the shell report it
+    # A leading 'VAR=value' is a shell variable assignment
+    if not argv or '=' in argv[0]:
+        return None
+    return argv
+
+def run_command(command):
+    """Runs a job command, skipping the shell for plain 'program arg ...' commands."""
+    options = dict(capture_output=True, text=True, timeout=300)  # 5-minute timeout
+    argv = split_command(command)
+    if argv is not None:
+        try:
+            return subprocess.run(argv, **options)
+        except FileNotFoundError:
+            pass  # Not a program on PATH (e.g. a shell builtin like 'exit'); ask the shell
+    return subprocess.run(command, shell=True, **options)
+
 def execute_job(job):
     """Executes the job command and handles success/failure."""
     try:
         # Execute the command
-        # On Windows, 'shell=True' is often needed for commands like 'echo'
-        result = subprocess.run(
-            job['command'],
-            shell=True,
-            capture_output=True,
-            text=True,
-            timeout=300,  # 5-minute timeout
-        )
+        result = run_command(job['command'])
 
         if result.returncode == 0:
             # Success
@@ -92,25 +162,22 @@ def handle_job_failure(job, timed_out=False):
         
         # --- FIX IS HERE ---
         # We must update BOTH the state and the final attempt count
-        now = datetime.utcnow().isoformat()
-        with db.get_db_connection() as conn:
-            conn.execute(
-                "UPDATE jobs SET state = 'dead', attempts = ?, updated_at = ? WHERE id = ?",
-                (new_attempts, now, job_id),
-            )
-            conn.commit()
+        db.update_failed_job(job_id, 'dead', new_attempts)
         # --- END FIX ---
         
     else:
         # Schedule for retry
         backoff_base = int(db.get_config_value('backoff_base'))
-        delay_seconds = backoff_base ** new_attempts
+        if backoff_base == 2:
+            delay_seconds = 1 << new_attempts  # Default base
+        else:
+            delay_seconds = backoff_base ** new_attempts
         
         # Add jitter: +/- 10% of the delay
         jitter = delay_seconds * 0.1
-        delay_seconds += (jitter * (2 * time.time() % 1 - 1)) # Simple jitter
+        delay_seconds += jitter_rng.uniform(-jitter, jitter)
         
-        new_run_at = datetime.utcnow() + timedelta(seconds=delay_seconds)
+        new_run_at = int((time.time() + delay_seconds) * 1000)  # epoch milliseconds
         
         print(f"Job {job_id} failed. Retrying in {delay_seconds:.2f}s (Attempt {new_attempts}).")
-        db.update_job_for_retry(job_id, new_attempts, new_run_at)
+        db.update_failed_job(job_id, 'pending', new_attempts, new_run_at)